@@ -0,0 +1,143 @@
+import copy
+import itertools
+import logging
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+class AggregateCube:
+    """Materialized aggregates of numeric columns by low-cardinality dimensions.
+
+    For every low-cardinality column, and every pair of them whose combined
+    cardinality stays small, the cube stores count, sum, min, max and sum of
+    squares of each numeric column. That is enough to answer
+    df.groupby(by)[column].<count|sum|min|max|mean|var|std>() without scanning
+    the full frame. Pairs are added smallest first until the overall budget of
+    max_total_cells (groups x measures) is spent.
+    """
+    def __init__(self, df: pd.DataFrame, max_cardinality: int = 50, max_cells: int = 10000,
+                 max_total_cells: int = 500000):
+        self.max_cardinality = max_cardinality
+        self.max_cells = max_cells
+        self.max_total_cells = max_total_cells
+
+        cardinality = {col: df[col].nunique() for col in df.columns}
+        self.dimensions = [col for col in df.columns if cardinality[col] <= max_cardinality]
+        self.measures = [col for col in df.columns
+                         if pd.api.types.is_numeric_dtype(df[col]) and not pd.api.types.is_bool_dtype(df[col])]
+
+        # dims tuple -> {statistic -> DataFrame indexed by the dims, one column per measure}
+        self.tables: Dict[Tuple[str, ...], Dict[str, pd.DataFrame]] = {}
+
+        def groups(dims):
+            return int(np.prod([max(cardinality[dim], 1) for dim in dims]))
+
+        # Single dimensions first, then the smallest pairs
+        pairs = [pair for pair in itertools.combinations(self.dimensions, 2) if groups(pair) <= max_cells]
+        dim_sets = [(dim,) for dim in self.dimensions] + sorted(pairs, key=groups)
+
+        cells = 0
+        for dims in dim_sets:
+            measures = [col for col in self.measures if col not in dims]
+            if not measures:
+                continue
+            cost = groups(dims) * len(measures)
+            if cells + cost > max_total_cells:
+                if len(dims) == 1:
+                    continue
+                logger.info(f"Aggregate cube budget of {max_total_cells} cells spent, skipping remaining pairs")
+                break
+            self.tables[dims] = self._aggregate(df, dims, measures)
+            cells += cost
+
+        logger.info(f"Built aggregate cube with {len(self.tables)} dimension sets "
+                    f"over {len(self.measures)} numeric columns")
+
+    def append(self, rows: pd.DataFrame) -> "AggregateCube":
+        """Return a new cube covering this cube's data plus rows
+        
+        Only rows are scanned; existing tables are merged with their aggregates.
+        The dimension sets are kept as they are, even if rows push a column over
+        max_cardinality.
+        """
+        cube = copy.copy(self)
+        cube.tables = {}
+        for dims, table in self.tables.items():
+            measures = list(table["count"].columns)
+            new = self._aggregate(rows, dims, measures)
+            levels = list(range(len(dims)))
+            cube.tables[dims] = {
+                "count": table["count"].add(new["count"], fill_value=0).astype("int64"),
+                "sum": table["sum"].add(new["sum"], fill_value=0),
+                "min": pd.concat([table["min"], new["min"]]).groupby(level=levels).min(),
+                "max": pd.concat([table["max"], new["max"]]).groupby(level=levels).max(),
+                "sumsq": table["sumsq"].add(new["sumsq"], fill_value=0)
+            }
+        return cube
+
+    def has(self, by: Union[str, List[str]], column: str) -> bool:
+        """Whether the cube can answer an aggregation of column grouped by by"""
+        dims, _ = self._lookup(by)
+        return dims is not None and column in self.tables[dims]["count"].columns
+
+    def agg(self, by: Union[str, List[str]], column: str, func: str = "mean") -> Optional[pd.Series]:
+        """Answer df.groupby(by)[column].<func>() from the cube, or None if not covered"""
+        if not self.has(by, column):
+            return None
+        dims, swapped = self._lookup(by)
+
+        table = self.tables[dims]
+        count = table["count"][column]
+        if func in ("count", "sum", "min", "max"):
+            result = table[func][column]
+        elif func == "mean":
+            result = table["sum"][column] / count
+        elif func in ("var", "std"):
+            total = table["sum"][column]
+            var = (table["sumsq"][column] - total ** 2 / count) / (count - 1)
+            var = var.clip(lower=0).where(count > 1)
+            result = np.sqrt(var) if func == "std" else var
+        else:
+            return None
+
+        if swapped:
+            result = result.swaplevel().sort_index()
+        else:
+            result = result.copy()
+        result.name = column
+        return result
+
+    def describe(self) -> str:
+        """Short description of the cube for the prompt, listing only covered groupings"""
+        if not self.tables:
+            return ""
+        covered = "; ".join(repr(dims[0]) if len(dims) == 1 else repr(list(dims)) for dims in self.tables)
+        return (f"Pre-computed group aggregates are available as `cube`. "
+                f"cube.agg(by, column, func) returns the same Series as df.groupby(by)[column].func() "
+                f"for func in count, sum, min, max, mean, var, std, where by is one of: {covered} "
+                f"and column is one of {', '.join(self.measures)} (other than the grouping columns). "
+                f"It returns None for any other combination, so always check the result and fall back "
+                f"to df.groupby when it is None.")
+
+    def _aggregate(self, df: pd.DataFrame, dims: Tuple[str, ...], measures: List[str]) -> Dict[str, pd.DataFrame]:
+        """Compute the stored statistics of measures grouped by dims"""
+        keys = [df[dim] for dim in dims]
+        grouped = df[measures].groupby(keys)
+        return {
+            "count": grouped.count(),
+            "sum": grouped.sum(),
+            "min": grouped.min(),
+            "max": grouped.max(),
+            "sumsq": df[measures].astype(float).pow(2).groupby(keys).sum()
+        }
+
+    def _lookup(self, by: Union[str, List[str]]) -> Tuple[Optional[Tuple[str, ...]], bool]:
+        """Return the stored dimension set for by and whether its pair order is reversed"""
+        dims = (by,) if isinstance(by, str) else tuple(by)
+        if dims in self.tables:
+            return dims, False
+        if len(dims) == 2 and dims[::-1] in self.tables:
+            return dims[::-1], True
+        return None, False
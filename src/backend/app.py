@@ -1,5 +1,5 @@
 
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context
 from flask_cors import CORS
 import pandas as pd
 import matplotlib
@@ -14,6 +14,9 @@ from data_manager import DataManager
 from prompt_engineer import PromptEngineer
 from llm_client import LLMClient
 from code_executor import CodeExecutor
+from request_coalescer import RequestCoalescer
+from intent_matcher import IntentMatcher
+from session_manager import SessionManager
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, 
@@ -25,10 +28,13 @@ app = Flask(__name__)
 CORS(app)  # Enable CORS
 
 # Initialize components
-data_manager = DataManager()
+data_manager = DataManager(optimize_memory=os.environ.get('OPTIMIZE_MEMORY', '0') == '1')
 prompt_engineer = PromptEngineer()
 llm_client = LLMClient()
 code_executor = CodeExecutor()
+request_coalescer = RequestCoalescer()
+intent_matcher = IntentMatcher()
+session_manager = SessionManager()
 
 @app.route('/api/datasets', methods=['GET'])
 def list_datasets():
@@ -52,6 +58,129 @@ def get_dataset_info(dataset_id):
         logger.error(f"Error getting dataset info: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+def encode_figure():
+    """Render the current figure to a base64 PNG and close it"""
+    img_data = io.BytesIO()
+    plt.savefig(img_data, format='png')
+    img_data.seek(0)
+    encoded_img = base64.b64encode(img_data.getvalue()).decode('utf-8')
+    plt.close()  # Close the figure to free memory
+    return encoded_img
+
+def generate_llm_code(query, df, session, cube):
+    """Ask the LLM for code answering query, with the session's context"""
+    # Generate prompt for code
+    columns = list(df.columns)
+    code_prompt = prompt_engineer.session_prompt(query, columns,
+                                                 session_manager.describe_frames(session) if session else {},
+                                                 session.history if session else [],
+                                                 cube.describe() if cube else None)
+    
+    # Generate code from LLM
+    return llm_client.generate_code(code_prompt)
+
+def analysis_steps(query, dataset_id, session, progressive=False):
+    """Generate, execute and explain code for a query, yielding (payload, status)
+    
+    In progressive mode the code first runs on the dataset's cached sample and a
+    preview is yielded before the full execution; a failure on the sample stops
+    there without scanning the full dataset. Otherwise a single result is yielded.
+    """
+    # Load and preprocess dataset
+    df = data_manager.get_dataset(dataset_id)
+    if df is None:
+        yield {"error": f"Dataset '{dataset_id}' not found"}, 404
+        return
+    
+    # Intermediate frames kept from earlier steps of this session, if any
+    frames = session_manager.get_frames(session) if session else {}
+    produced = {}
+    cube = data_manager.get_cube(dataset_id)
+    
+    # The first execution runs on the sample when previewing
+    sample = data_manager.get_sample(dataset_id) if progressive else None
+    first_data = sample if sample is not None else df
+    first_produced = produced if sample is None else {}
+    
+    # Simple, common intents are answered from templates without the LLM
+    template = intent_matcher.match(query, df)
+    if template:
+        generated_code = template["code"]
+        result = code_executor.safe_execute(generated_code, first_data, frames, first_produced, cube)
+        if isinstance(result, str) and result.startswith("Error:"):
+            logger.warning(f"Template code failed, falling back to LLM: {result}")
+            template = None
+            first_produced.clear()
+    
+    if not template:
+        generated_code = generate_llm_code(query, df, session, cube)
+        if not generated_code:
+            yield {"error": "Failed to generate code"}, 500
+            return
+        
+        # Execute code safely
+        result = code_executor.safe_execute(generated_code, first_data, frames, first_produced, cube)
+        
+        # Check if result is an error message
+        if isinstance(result, str) and result.startswith("Error:"):
+            yield {"error": result, "code": generated_code}, 400
+            return
+    
+    if sample is not None:
+        yield {
+            "code": generated_code,
+            "image": encode_figure(),
+            "preview": True,
+            "sample_rows": len(sample),
+            "rows": len(df),
+            "source": "template" if template else "llm",
+            "session_id": session.session_id if session else None,
+            "success": True
+        }, 200
+        
+        # Now the full dataset
+        result = code_executor.safe_execute(generated_code, df, frames, produced, cube)
+        if isinstance(result, str) and result.startswith("Error:") and template:
+            # A template failure is ours, not the user's: fall back to the LLM
+            logger.warning(f"Template code failed on full data, falling back to LLM: {result}")
+            template = None
+            produced.clear()
+            generated_code = generate_llm_code(query, df, session, cube)
+            if not generated_code:
+                yield {"error": "Failed to generate code"}, 500
+                return
+            result = code_executor.safe_execute(generated_code, df, frames, produced, cube)
+        
+        if isinstance(result, str) and result.startswith("Error:"):
+            yield {"error": result, "code": generated_code}, 400
+            return
+    
+    if session:
+        session_manager.record_step(session, query, produced)
+    
+    # Generate explanation for the visualization
+    if template:
+        explanation = template["explanation"]
+    else:
+        explanation_prompt = f"Explain this data visualization in plain English. The query was: '{query}'. The code is: {generated_code}"
+        explanation = llm_client.generate_explanation(explanation_prompt)
+    
+    yield {
+        "code": generated_code,
+        "image": encode_figure(),
+        "explanation": explanation,
+        "preview": False,
+        "source": "template" if template else "llm",
+        "session_id": session.session_id if session else None,
+        "success": True
+    }, 200
+
+def run_analysis(query, dataset_id, session):
+    """Run an analysis to completion and return its final (payload, status)"""
+    for payload, status in analysis_steps(query, dataset_id, session):
+        pass
+    return payload, status
+
 @app.route('/api/analyze', methods=['POST'])
 def analyze_data():
     """Process a natural language query and return code, visualization, and explanation"""
@@ -63,49 +192,42 @@ def analyze_data():
         query = data['query']
         dataset_id = data['dataset']
         
-        # Load and preprocess dataset
-        df = data_manager.get_dataset(dataset_id)
-        if df is None:
-            return jsonify({"error": f"Dataset '{dataset_id}' not found"}), 404
-        
-        # Generate prompt for code
-        columns = list(df.columns)
-        code_prompt = prompt_engineer.zero_shot_prompt(query, columns)
-        
-        # Generate code from LLM
-        generated_code = llm_client.generate_code(code_prompt)
-        if not generated_code:
-            return jsonify({"error": "Failed to generate code"}), 500
-        
-        # Execute code safely
-        result = code_executor.safe_execute(generated_code, df)
-        
-        # Check if result is an error message
-        if isinstance(result, str) and result.startswith("Error:"):
-            return jsonify({"error": result, "code": generated_code}), 400
-        
-        # Generate explanation for the visualization
-        explanation_prompt = f"Explain this data visualization in plain English. The query was: '{query}'. The code is: {generated_code}"
-        explanation = llm_client.generate_explanation(explanation_prompt)
+        # Server-side state is only kept for callers that ask for a session
+        session_id = data.get('session_id')
+        session = session_manager.get_session(str(session_id), dataset_id) if session_id else None
         
-        # Convert plot to base64 image
-        img_data = io.BytesIO()
-        plt.savefig(img_data, format='png')
-        img_data.seek(0)
-        encoded_img = base64.b64encode(img_data.getvalue()).decode('utf-8')
-        plt.close()  # Close the figure to free memory
+        if data.get('progressive'):
+            # Stream the sample preview and then the final result as JSON lines
+            def stream():
+                try:
+                    for payload, status in analysis_steps(query, dataset_id, session, progressive=True):
+                        yield json.dumps(dict(payload, status=status)) + "\n"
+                except Exception as e:
+                    logger.error(f"Error analyzing data: {str(e)}")
+                    yield json.dumps({"error": str(e), "status": 500}) + "\n"
+            return Response(stream_with_context(stream()), mimetype='application/x-ndjson')
         
-        return jsonify({
-            "code": generated_code,
-            "image": encoded_img,
-            "explanation": explanation,
-            "success": True
-        })
+        # Identical concurrent requests share a single computation
+        key = (dataset_id, session.session_id if session else None, " ".join(query.split()))
+        payload, status = request_coalescer.run(key, lambda: run_analysis(query, dataset_id, session))
+        return jsonify(payload), status
         
     except Exception as e:
         logger.error(f"Error analyzing data: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/sessions/<session_id>', methods=['DELETE'])
+def end_session(session_id):
+    """Drop a chat session and its cached intermediate frames"""
+    if session_manager.end_session(session_id):
+        return jsonify({"success": True})
+    return jsonify({"error": "Session not found"}), 404
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Return request coalescing metrics"""
+    return jsonify({"coalescing": request_coalescer.get_stats()})
+
 @app.route('/api/upload', methods=['POST'])
 def upload_dataset():
     """Handle user dataset uploads"""
@@ -130,5 +252,30 @@ def upload_dataset():
         logger.error(f"Error uploading dataset: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/datasets/<dataset_id>/append', methods=['POST'])
+def append_dataset(dataset_id):
+    """Append rows to a dataset, creating a new version of it"""
+    try:
+        if 'file' not in request.files:
+            return jsonify({"error": "No file part"}), 400
+            
+        file = request.files['file']
+        if file.filename == '':
+            return jsonify({"error": "No selected file"}), 400
+            
+        # Check file size (limit to 10MB)
+        if len(file.read()) > 10 * 1024 * 1024:  # 10MB in bytes
+            return jsonify({"error": "File too large (max 10MB)"}), 400
+        file.seek(0)  # Reset file pointer after reading
+        
+        new_id = data_manager.append_to_dataset(dataset_id, file)
+        return jsonify({"success": True, "dataset_id": new_id, "parent": dataset_id})
+        
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error appending to dataset: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 if __name__ == '__main__':
     app.run(debug=True, port=5001)
@@ -8,14 +8,14 @@ matplotlib.use('Agg')  # Set non-interactive backend for server
 import matplotlib.pyplot as plt
 import seaborn as sns
 import io
-from typing import Union, Any, Dict, Set
+from typing import Union, Any, Dict, Set, Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
 class RestrictedGlobals:
     """Define a restricted subset of globals for code execution"""
-    def __init__(self, dataset: pd.DataFrame):
+    def __init__(self, dataset: pd.DataFrame, frames: Optional[Dict[str, Any]] = None, cube: Any = None):
         # Safe modules and functions
         self.globals = {
             'pd': pd,
@@ -23,6 +23,7 @@ class RestrictedGlobals:
             'plt': plt,
             'sns': sns,
             'df': dataset,  # The dataset to work with
+            'cube': cube,  # Pre-computed group aggregates, if available
             
             # Built-in functions that are safe
             'len': len,
@@ -49,6 +50,14 @@ class RestrictedGlobals:
             'False': False,
             'None': None,
         }
+        
+        # Names that belong to the sandbox itself rather than to the session
+        self.reserved = set(self.globals)
+        
+        # Intermediate frames from earlier steps of a session
+        for name, frame in (frames or {}).items():
+            if name not in self.globals:
+                self.globals[name] = frame
 
 class CodeAnalyzer(ast.NodeVisitor):
     """AST visitor to check for potentially dangerous operations"""
@@ -104,8 +113,14 @@ class CodeExecutor:
         except SyntaxError as e:
             return [f"Syntax error: {str(e)}"]
     
-    def safe_execute(self, code: str, dataset: pd.DataFrame) -> Union[matplotlib.figure.Figure, str]:
-        """Safely execute code and return the result or error message"""
+    def safe_execute(self, code: str, dataset: pd.DataFrame, frames: Optional[Dict[str, Any]] = None,
+                     produced: Optional[Dict[str, Any]] = None, cube: Any = None) -> Union[matplotlib.figure.Figure, str]:
+        """Safely execute code and return the result or error message
+        
+        frames are exposed to the code as extra variables. If produced is given,
+        it is filled with the DataFrames/Series the code assigned to variables.
+        cube is exposed as `cube` for answering group aggregates without a scan.
+        """
         # First check code safety
         safety_issues = self.check_code_safety(code)
         if safety_issues:
@@ -116,14 +131,30 @@ class CodeExecutor:
         # Close any existing figures
         plt.close('all')
         
+        # Executed code gets its own copy so in-place changes can't leak into the
+        # shared cache (and out of sync with its aggregate cube)
+        dataset = dataset.copy()
+        
         # Prepare restricted globals
-        restricted_globals = RestrictedGlobals(dataset).globals
+        restricted = RestrictedGlobals(dataset, frames, cube)
+        restricted_globals = restricted.globals
+        initial_values = {name: id(value) for name, value in restricted_globals.items()}
         
         # Execute in try-except block
         try:
             # Execute the code with timeout
             exec(compile(code, '<string>', 'exec'), restricted_globals)
             
+            # Collect new or reassigned frames for the caller
+            if produced is not None:
+                for name, value in restricted_globals.items():
+                    if name.startswith('_') or name in restricted.reserved or value is dataset:
+                        continue
+                    if not isinstance(value, (pd.DataFrame, pd.Series)):
+                        continue
+                    if initial_values.get(name) != id(value):
+                        produced[name] = value
+            
             # Get the current figure
             if plt.get_fignums():
                 fig = plt.gcf()
@@ -2,16 +2,34 @@
 import pandas as pd
 import numpy as np
 import os
-import uuid
+import io
+import json
+import hashlib
+import shutil
+import tempfile
 from typing import Dict, List, Optional, Any
 import logging
 from werkzeug.utils import secure_filename
+from aggregate_cube import AggregateCube
 
 logger = logging.getLogger(__name__)
 
+# Arrow-backed strings are used for high-cardinality text columns when pyarrow is installed
+try:
+    import pyarrow  # noqa: F401
+    STRING_DTYPE = "string[pyarrow]"
+except ImportError:
+    STRING_DTYPE = None
+
 class DataManager:
-    def __init__(self):
-        """Initialize with predefined datasets and create necessary directories"""
+    def __init__(self, optimize_memory: bool = False):
+        """Initialize with predefined datasets and create necessary directories
+        
+        With optimize_memory, loaded datasets use compact dtypes (categoricals,
+        Arrow strings, downcast and nullable numbers) inferred once and persisted
+        next to the CSV file.
+        """
+        self.optimize_memory = optimize_memory
         self.datasets_dir = os.path.join(os.path.dirname(__file__), "datasets")
         self.uploads_dir = os.path.join(os.path.dirname(__file__), "uploads")
         
@@ -44,6 +62,16 @@ class DataManager:
         # Cache for loaded datasets
         self.loaded_datasets = {}
         
+        # Aggregate cubes built when a dataset is loaded
+        self.cubes = {}
+        
+        # Stratified samples used for fast previews and dry runs
+        self.samples = {}
+        self.sample_size = 5000
+        
+        # Memory footprint before/after dtype optimization, per dataset
+        self.memory_usage = {}
+        
         # Load predefined datasets
         self.load_predefined_datasets()
     
@@ -72,30 +100,85 @@ class DataManager:
                     "rows": len(df),
                     "columns_count": len(df.columns)
                 })
+                
+                # Load into the cache so the aggregate cube is built up front
+                self.get_dataset(dataset_id)
             except Exception as e:
                 logger.error(f"Error loading dataset {dataset_id}: {str(e)}")
     
-    def preprocess(self, df: pd.DataFrame) -> pd.DataFrame:
-        """Clean and preprocess the dataframe"""
+    def preprocess(self, df: pd.DataFrame, fill_values: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+        """Clean and preprocess the dataframe
+        
+        Missing values are filled from fill_values when given (e.g. the values
+        computed when a dataset was first ingested), otherwise from the frame itself.
+        """
         # Make a copy to avoid modifying the original
         df = df.copy()
         
         # Lowercase column names and replace spaces with underscores
         df.columns = [col.lower().replace(' ', '_') for col in df.columns]
         
+        if fill_values is None:
+            fill_values = self.compute_fill_values(df)
+        
+        for col, value in fill_values.items():
+            if col in df.columns and df[col].isna().any():
+                df[col] = df[col].fillna(value)
+        
+        return df
+    
+    def compute_fill_values(self, df: pd.DataFrame) -> Dict[str, Any]:
+        """Values used to fill missing data: median for numeric, mode for categorical columns"""
+        fill_values = {}
+        
         # Fill missing numeric values with median
         numeric_cols = df.select_dtypes(include=['number']).columns
         for col in numeric_cols:
-            if df[col].isna().any():
-                df[col] = df[col].fillna(df[col].median())
+            if df[col].notna().any():
+                fill_values[col] = float(df[col].median())
         
         # Fill missing categorical values with mode
-        categorical_cols = df.select_dtypes(include=['object']).columns
+        categorical_cols = df.select_dtypes(include=['object', 'category', 'string']).columns
         for col in categorical_cols:
-            if df[col].isna().any():
-                df[col] = df[col].fillna(df[col].mode()[0] if not df[col].mode().empty else "unknown")
+            mode = df[col].mode()
+            fill_values[col] = mode[0] if not mode.empty else "unknown"
         
-        return df
+        return fill_values
+    
+    def compute_column_stats(self, df: pd.DataFrame) -> Dict[str, Dict[str, float]]:
+        """Mergeable summary statistics for each numeric column"""
+        stats = {}
+        for col in df.select_dtypes(include=['number']).columns:
+            values = df[col].dropna()
+            if values.empty:
+                continue
+            stats[col] = {
+                "count": int(values.count()),
+                "sum": float(values.sum()),
+                "min": float(values.min()),
+                "max": float(values.max()),
+                "mean": float(values.mean())
+            }
+        return stats
+    
+    def merge_column_stats(self, old: Dict[str, Dict[str, float]],
+                           new: Dict[str, Dict[str, float]]) -> Dict[str, Dict[str, float]]:
+        """Combine the statistics of a dataset with those of rows appended to it"""
+        merged = {}
+        for col in set(old) | set(new):
+            if col not in old or col not in new:
+                merged[col] = dict(old.get(col) or new[col])
+                continue
+            count = old[col]["count"] + new[col]["count"]
+            total = old[col]["sum"] + new[col]["sum"]
+            merged[col] = {
+                "count": count,
+                "sum": total,
+                "min": min(old[col]["min"], new[col]["min"]),
+                "max": max(old[col]["max"], new[col]["max"]),
+                "mean": total / count
+            }
+        return merged
     
     def get_dataset(self, dataset_id: str) -> Optional[pd.DataFrame]:
         """Load and return a dataset by ID"""
@@ -105,7 +188,10 @@ class DataManager:
                 # Load from cache or file
                 if dataset_id not in self.loaded_datasets:
                     file_path = os.path.join(self.datasets_dir, f"{dataset_id}.csv")
-                    self.loaded_datasets[dataset_id] = pd.read_csv(file_path)
+                    self.loaded_datasets[dataset_id] = self.read_dataset(dataset_id, file_path)
+                    self.build_cube(dataset_id)
+                    if dataset_id in self.memory_usage:
+                        self.dataset_info[dataset_id]["memory"] = self.memory_usage[dataset_id]
                 return self.loaded_datasets[dataset_id]
             except Exception as e:
                 logger.error(f"Error loading dataset {dataset_id}: {str(e)}")
@@ -116,7 +202,8 @@ class DataManager:
         if os.path.exists(upload_path):
             try:
                 if dataset_id not in self.loaded_datasets:
-                    self.loaded_datasets[dataset_id] = pd.read_csv(upload_path)
+                    self.loaded_datasets[dataset_id] = self.read_dataset(dataset_id, upload_path)
+                    self.build_cube(dataset_id)
                 return self.loaded_datasets[dataset_id]
             except Exception as e:
                 logger.error(f"Error loading user dataset {dataset_id}: {str(e)}")
@@ -124,6 +211,243 @@ class DataManager:
         
         return None
     
+    def read_dataset(self, dataset_id: str, path: str) -> pd.DataFrame:
+        """Read a dataset CSV, applying its compact dtypes in memory-optimized mode"""
+        if not self.optimize_memory:
+            return pd.read_csv(path)
+        
+        schema = self._load_schema(dataset_id, path)
+        if schema:
+            try:
+                df = pd.read_csv(path, dtype=schema["dtypes"])
+                self.memory_usage[dataset_id] = schema["memory"]
+                return df
+            except Exception as e:
+                # e.g. appended values no longer fit the stored dtypes
+                logger.warning(f"Stored dtypes for {dataset_id} no longer apply, re-inferring: {str(e)}")
+        
+        return self.compact(dataset_id, path, pd.read_csv(path))
+    
+    def compact(self, dataset_id: str, path: str, df: pd.DataFrame) -> pd.DataFrame:
+        """Convert df to compact dtypes, persist them next to path and record memory use"""
+        before = int(df.memory_usage(deep=True).sum())
+        dtypes = self.infer_compact_dtypes(df)
+        df = df.astype(dtypes)
+        after = int(df.memory_usage(deep=True).sum())
+        
+        logger.info(f"Compacted {dataset_id} from {before} to {after} bytes")
+        self._save_schema(dataset_id, path, dtypes, {"before_bytes": before, "after_bytes": after})
+        return df
+    
+    def append_compact(self, dataset_id: str, path: str, parent_df: pd.DataFrame,
+                       new_rows: pd.DataFrame, parent_schema: Dict[str, Any]) -> pd.DataFrame:
+        """Concatenate new rows onto a compacted parent, widening its dtypes only where needed
+        
+        Only the new rows are inspected; a parent column is converted only when the
+        new values don't fit its dtype.
+        """
+        before_new = int(new_rows.memory_usage(deep=True).sum())
+        parent_df = parent_df.copy(deep=False)  # the parent stays cached as it is
+        new_rows = new_rows.copy()
+        dtypes = dict(parent_schema["dtypes"])
+        
+        for col, dtype in parent_schema["dtypes"].items():
+            values = new_rows[col].dropna()
+            
+            if dtype == "category":
+                # Extend the categories instead of falling back to object
+                missing = pd.Index(values.unique()).difference(parent_df[col].cat.categories)
+                if len(missing):
+                    parent_df[col] = parent_df[col].cat.add_categories(missing)
+                new_rows[col] = pd.Categorical(new_rows[col], categories=parent_df[col].cat.categories)
+                continue
+            
+            if dtype.lower().startswith("int"):
+                if len(values) and not (values == values.round()).all():
+                    dtypes[col] = "float64"
+                else:
+                    # Wide enough for both the parent's dtype and the new values
+                    info = np.iinfo(dtype.lower())
+                    bounds = pd.Series([info.min, info.max] + ([values.min(), values.max()] if len(values) else []))
+                    nullable = dtype.startswith("Int") or new_rows[col].isna().any()
+                    dtypes[col] = self._smallest_int(bounds, nullable)
+            elif dtype == "float32":
+                if not (values.astype("float32").astype("float64") == values).all():
+                    dtypes[col] = "float64"
+            
+            if dtypes[col] != dtype:
+                logger.info(f"Widening {col} from {dtype} to {dtypes[col]} for {dataset_id}")
+                parent_df[col] = parent_df[col].astype(dtypes[col])
+            new_rows[col] = new_rows[col].astype(dtypes[col])
+        
+        combined = pd.concat([parent_df, new_rows], ignore_index=True)
+        
+        # Parent figures plus the new rows; widened parent columns make this an estimate
+        after_new = int(new_rows.memory_usage(deep=True).sum())
+        self._save_schema(dataset_id, path, dtypes, {
+            "before_bytes": parent_schema["memory"]["before_bytes"] + before_new,
+            "after_bytes": parent_schema["memory"]["after_bytes"] + after_new
+        })
+        return combined
+    
+    def infer_compact_dtypes(self, df: pd.DataFrame) -> Dict[str, str]:
+        """Choose the smallest dtype that holds each column's values exactly
+        
+        Floats are only downcast to float32 when every value survives the round trip.
+        """
+        dtypes = {}
+        for col in df.columns:
+            series = df[col]
+            values = series.dropna()
+            
+            if series.dtype == object:
+                # Low-cardinality strings become categoricals
+                if len(values) and values.nunique() <= 0.5 * len(values):
+                    dtypes[col] = "category"
+                elif STRING_DTYPE and values.map(type).eq(str).all():
+                    dtypes[col] = STRING_DTYPE
+            
+            elif pd.api.types.is_integer_dtype(series) and not pd.api.types.is_bool_dtype(series):
+                dtypes[col] = self._smallest_int(values, nullable=False)
+            
+            elif pd.api.types.is_float_dtype(series) and len(values):
+                if (values == values.round()).all() and values.abs().max() < 2 ** 53:
+                    # Integers stored as float because of missing values
+                    dtypes[col] = self._smallest_int(values, nullable=series.isna().any())
+                else:
+                    if (values.astype("float32").astype("float64") == values).all():
+                        dtypes[col] = "float32"
+        
+        return dtypes
+    
+    def _smallest_int(self, values: pd.Series, nullable: bool) -> str:
+        """Name of the smallest integer dtype that holds values"""
+        low, high = (values.min(), values.max()) if len(values) else (0, 0)
+        for bits in (8, 16, 32, 64):
+            info = np.iinfo(f"int{bits}")
+            if info.min <= low and high <= info.max:
+                return f"Int{bits}" if nullable else f"int{bits}"
+        return "Int64" if nullable else "int64"
+    
+    def get_memory_usage(self, dataset_id: str) -> Optional[Dict[str, int]]:
+        """Memory footprint before/after dtype optimization, if the dataset was compacted"""
+        if dataset_id in self.memory_usage:
+            return self.memory_usage[dataset_id]
+        path = self._dataset_path(dataset_id)
+        schema = self._load_schema(dataset_id, path) if path else None
+        return schema["memory"] if schema else None
+    
+    def _load_schema(self, dataset_id: str, path: str) -> Optional[Dict[str, Any]]:
+        """Return the persisted compact dtypes and memory use stored next to path"""
+        schema_path = os.path.splitext(path)[0] + ".dtypes.json"
+        if not os.path.exists(schema_path):
+            return None
+        try:
+            with open(schema_path) as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Error reading dtypes for {dataset_id}: {str(e)}")
+            return None
+    
+    def _save_schema(self, dataset_id: str, path: str, dtypes: Dict[str, str], memory: Dict[str, int]):
+        """Persist compact dtypes and memory use next to path"""
+        self.memory_usage[dataset_id] = memory
+        try:
+            with open(os.path.splitext(path)[0] + ".dtypes.json", "w") as f:
+                json.dump({"dtypes": dtypes, "memory": memory}, f)
+        except Exception as e:
+            logger.error(f"Error saving dtypes for {dataset_id}: {str(e)}")
+    
+    def build_cube(self, dataset_id: str):
+        """Build the aggregate cube for a loaded dataset"""
+        try:
+            self.cubes[dataset_id] = AggregateCube(self.loaded_datasets[dataset_id])
+        except Exception as e:
+            # Generated code can still aggregate the full frame without a cube
+            logger.error(f"Error building aggregate cube for {dataset_id}: {str(e)}")
+            self.cubes.pop(dataset_id, None)
+    
+    def get_cube(self, dataset_id: str) -> Optional[AggregateCube]:
+        """Return the aggregate cube for a dataset, loading it if necessary"""
+        if dataset_id not in self.cubes:
+            self.get_dataset(dataset_id)
+        return self.cubes.get(dataset_id)
+    
+    def _dataset_path(self, dataset_id: str) -> Optional[str]:
+        """Return the CSV path of a predefined or uploaded dataset, if it exists"""
+        if dataset_id in self.dataset_info:
+            return os.path.join(self.datasets_dir, f"{dataset_id}.csv")
+        upload_path = os.path.join(self.uploads_dir, f"{secure_filename(dataset_id)}.csv")
+        return upload_path if os.path.exists(upload_path) else None
+    
+    def _metadata_path(self, dataset_id: str) -> str:
+        return os.path.join(self.uploads_dir, f"{secure_filename(dataset_id)}.json")
+    
+    def load_metadata(self, dataset_id: str) -> Optional[Dict[str, Any]]:
+        """Return stored ingest metadata for an uploaded dataset, if any"""
+        metadata_path = self._metadata_path(dataset_id)
+        if not os.path.exists(metadata_path):
+            return None
+        try:
+            with open(metadata_path) as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Error reading metadata for dataset {dataset_id}: {str(e)}")
+            return None
+    
+    def save_metadata(self, dataset_id: str, metadata: Dict[str, Any]):
+        """Persist ingest metadata for an uploaded dataset"""
+        temp_path = self._temp_path()
+        try:
+            with open(temp_path, "w") as f:
+                json.dump(metadata, f)
+            os.replace(temp_path, self._metadata_path(dataset_id))
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    
+    def _temp_path(self) -> str:
+        """Return a new temporary file in uploads_dir, to be moved into place with os.replace
+        
+        Files only appear under their final name once complete, so a concurrent
+        request that finds a dataset ID already present never reads a partial file.
+        """
+        fd, temp_path = tempfile.mkstemp(dir=self.uploads_dir, suffix=".tmp")
+        os.close(fd)
+        return temp_path
+    
+    def get_sample(self, dataset_id: str) -> Optional[pd.DataFrame]:
+        """Return a cached stratified sample of a dataset
+        
+        Rows are sampled proportionally within each value of the lowest-cardinality
+        categorical column so small groups stay represented. Returns None when the
+        dataset is small enough that a sample would not save any work.
+        """
+        if dataset_id in self.samples:
+            return self.samples[dataset_id]
+        
+        df = self.get_dataset(dataset_id)
+        if df is None or len(df) <= self.sample_size:
+            return None
+        
+        fraction = self.sample_size / len(df)
+        categorical_cols = df.select_dtypes(include=['object', 'category', 'bool']).columns
+        cardinality = {col: df[col].nunique() for col in categorical_cols}
+        strata = [col for col, count in cardinality.items() if 1 < count <= 50]
+        
+        if strata:
+            column = min(strata, key=cardinality.get)
+            # Take the first rows of each stratum from a shuffled copy, at least one each
+            shuffled = df.sample(frac=1, random_state=0)
+            grouped = shuffled.groupby(column, dropna=False)[column]
+            quota = np.maximum(1, (grouped.transform('size') * fraction).round())
+            sample = shuffled[grouped.cumcount() < quota]
+        else:
+            sample = df.sample(n=self.sample_size, random_state=0)
+        
+        self.samples[dataset_id] = sample.sort_index()
+        return self.samples[dataset_id]
+    
     def list_datasets(self) -> List[Dict[str, Any]]:
         """Return a list of all available datasets with basic info"""
         datasets = []
@@ -145,6 +469,20 @@ class DataManager:
                 dataset_id = filename[:-4]  # Remove .csv extension
                 if dataset_id not in self.dataset_info:
                     try:
+                        metadata = self.load_metadata(dataset_id)
+                        if metadata:
+                            datasets.append({
+                                "id": dataset_id,
+                                "name": f"User dataset: {metadata['filename']}",
+                                "description": "User uploaded dataset",
+                                "predefined": False,
+                                "rows": metadata["rows"],
+                                "columns_count": len(metadata["columns"]),
+                                "version": metadata["version"],
+                                "parent": metadata["parent"]
+                            })
+                            continue
+                        
                         df = pd.read_csv(os.path.join(self.uploads_dir, filename), nrows=5)
                         datasets.append({
                             "id": dataset_id,
@@ -169,6 +507,23 @@ class DataManager:
         upload_path = os.path.join(self.uploads_dir, f"{dataset_id}.csv")
         if os.path.exists(upload_path):
             try:
+                metadata = self.load_metadata(dataset_id)
+                if metadata:
+                    # Stored statistics avoid re-reading the full file
+                    return {
+                        "name": f"User dataset: {metadata['filename']}",
+                        "description": "User uploaded dataset",
+                        "columns": metadata["columns"],
+                        "sample": pd.read_csv(upload_path, nrows=5).to_dict(orient="records"),
+                        "rows": metadata["rows"],
+                        "columns_count": len(metadata["columns"]),
+                        "column_stats": metadata["column_stats"],
+                        "memory": self.get_memory_usage(dataset_id),
+                        "version": metadata["version"],
+                        "parent": metadata["parent"],
+                        "predefined": False
+                    }
+                
                 df = pd.read_csv(upload_path)
                 return {
                     "name": f"User dataset: {dataset_id}",
@@ -177,6 +532,7 @@ class DataManager:
                     "sample": df.head(5).to_dict(orient="records"),
                     "rows": len(df),
                     "columns_count": len(df.columns),
+                    "memory": self.get_memory_usage(dataset_id),
                     "predefined": False
                 }
             except Exception as e:
@@ -184,32 +540,152 @@ class DataManager:
         
         return None
     
-    def upload_dataset(self, file):
-        """Process an uploaded dataset file"""
+    def upload_dataset(self, file) -> str:
+        """Process an uploaded dataset file
+        
+        Dataset IDs are derived from the file content, so uploading an identical
+        file again returns the existing dataset without re-processing it.
+        """
         # Secure filename to prevent directory traversal
         filename = secure_filename(file.filename)
         
-        # Generate a unique ID for this dataset
-        dataset_id = str(uuid.uuid4())[:8]
+        # Content-addressed ID for this dataset
+        content = file.read()
+        content_hash = hashlib.sha256(content).hexdigest()
+        dataset_id = content_hash[:12]
         
-        # Save the file
         upload_path = os.path.join(self.uploads_dir, f"{dataset_id}.csv")
-        file.save(upload_path)
+        if os.path.exists(upload_path):
+            logger.info(f"Upload of {filename} matches existing dataset {dataset_id}, reusing it")
+            return dataset_id
         
         # Load and preprocess
+        temp_path = self._temp_path()
         try:
-            df = pd.read_csv(upload_path)
+            df = pd.read_csv(io.BytesIO(content))
             df = self.preprocess(df)
-            df.to_csv(upload_path, index=False)
+            df.to_csv(temp_path, index=False)
+            
+            self.save_metadata(dataset_id, {
+                "filename": filename,
+                "content_hash": content_hash,
+                "parent": None,
+                "version": 1,
+                "rows": len(df),
+                "columns": list(df.columns),
+                "fill_values": self.compute_fill_values(df),
+                "column_stats": self.compute_column_stats(df)
+            })
+            os.replace(temp_path, upload_path)
             
             # Clear from cache if it exists
             if dataset_id in self.loaded_datasets:
                 del self.loaded_datasets[dataset_id]
+            self.cubes.pop(dataset_id, None)
+            self.samples.pop(dataset_id, None)
+            
+            # Load now so the aggregate cube is built at ingest time
+            self.get_dataset(dataset_id)
             
             return dataset_id
         except Exception as e:
-            # If there's an error, delete the uploaded file
-            if os.path.exists(upload_path):
-                os.remove(upload_path)
+            # Metadata without a CSV is ignored and overwritten by the next upload,
+            # so it is left alone rather than racing a concurrent identical upload
             logger.error(f"Error processing uploaded file: {str(e)}")
             raise e
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    
+    def append_to_dataset(self, dataset_id: str, file) -> str:
+        """Create a new version of a dataset with the rows from file appended
+        
+        Only the new rows are parsed and preprocessed. Stored statistics and the
+        aggregate cube are updated incrementally; the parent version and its
+        caches are left untouched.
+        """
+        parent_path = self._dataset_path(dataset_id)
+        if parent_path is None:
+            raise ValueError(f"Dataset '{dataset_id}' not found")
+        
+        parent_metadata = self.load_metadata(dataset_id)
+        if parent_metadata is None:
+            # Predefined or legacy upload: derive metadata from the data once
+            parent_df = self.get_dataset(dataset_id)
+            if parent_df is None:
+                raise ValueError(f"Dataset '{dataset_id}' could not be read")
+            parent_metadata = {
+                "filename": f"{dataset_id}.csv",
+                "content_hash": dataset_id,
+                "version": 1,
+                "rows": len(parent_df),
+                "columns": list(parent_df.columns),
+                "fill_values": self.compute_fill_values(self.preprocess(parent_df, {})),
+                "column_stats": self.compute_column_stats(parent_df)
+            }
+        
+        # The new version is addressed by its parent and the appended content
+        content = file.read()
+        content_hash = hashlib.sha256(parent_metadata["content_hash"].encode() + content).hexdigest()
+        new_id = content_hash[:12]
+        
+        new_path = os.path.join(self.uploads_dir, f"{new_id}.csv")
+        if os.path.exists(new_path):
+            logger.info(f"Append to {dataset_id} matches existing version {new_id}, reusing it")
+            return new_id
+        
+        new_rows = self.preprocess(pd.read_csv(io.BytesIO(content)), parent_metadata["fill_values"])
+        expected = [col.lower().replace(' ', '_') for col in parent_metadata["columns"]]
+        if list(new_rows.columns) != expected:
+            raise ValueError(f"Appended columns {list(new_rows.columns)} do not match "
+                             f"dataset columns {parent_metadata['columns']}")
+        # Predefined datasets are stored with their original column names
+        new_rows.columns = parent_metadata["columns"]
+        
+        temp_path = self._temp_path()
+        try:
+            # Copy the stored rows as-is and write only the new ones
+            shutil.copyfile(parent_path, temp_path)
+            new_rows.to_csv(temp_path, mode="a", header=False, index=False)
+            
+            self.save_metadata(new_id, {
+                "filename": parent_metadata["filename"],
+                "content_hash": content_hash,
+                "parent": dataset_id,
+                "version": parent_metadata["version"] + 1,
+                "rows": parent_metadata["rows"] + len(new_rows),
+                "columns": parent_metadata["columns"],
+                "fill_values": parent_metadata["fill_values"],
+                "column_stats": self.merge_column_stats(parent_metadata["column_stats"],
+                                                        self.compute_column_stats(new_rows))
+            })
+            os.replace(temp_path, new_path)
+        except Exception as e:
+            # As for uploads, leftover metadata without a CSV is harmless
+            logger.error(f"Error appending to dataset {dataset_id}: {str(e)}")
+            raise e
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        
+        try:
+            # Extend the parent's cached frame and cube instead of rebuilding them
+            if dataset_id in self.loaded_datasets:
+                parent_df = self.loaded_datasets[dataset_id]
+                parent_schema = self._load_schema(dataset_id, parent_path) if self.optimize_memory else None
+                if parent_schema:
+                    combined = self.append_compact(new_id, new_path, parent_df, new_rows, parent_schema)
+                else:
+                    combined = pd.concat([parent_df, new_rows], ignore_index=True)
+                self.loaded_datasets[new_id] = combined
+                if dataset_id in self.cubes:
+                    self.cubes[new_id] = self.cubes[dataset_id].append(new_rows)
+                else:
+                    self.build_cube(new_id)
+        except Exception as e:
+            # The new version is stored; it will be loaded from disk on first use
+            self.loaded_datasets.pop(new_id, None)
+            self.cubes.pop(new_id, None)
+            logger.error(f"Error caching new version {new_id} of {dataset_id}: {str(e)}")
+        
+        return new_id
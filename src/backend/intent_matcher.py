@@ -0,0 +1,233 @@
+import re
+import difflib
+import logging
+import pandas as pd
+from typing import List, Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class IntentMatcher:
+    """Answer simple, high-frequency chart requests from code templates.
+
+    Queries such as "histogram of age", "sepal length vs sepal width colored by
+    species" or "mean of fare by pclass" are matched against the dataset's
+    columns and turned into code directly, skipping the LLM round trip. Anything
+    that doesn't match with enough confidence returns None and goes to the LLM.
+    """
+    def __init__(self, min_confidence: float = 0.85, max_categories: int = 50):
+        self.min_confidence = min_confidence
+        # Above this many distinct values a bar chart is unreadable; leave it to the LLM
+        self.max_categories = max_categories
+
+        # Leading filler words stripped before matching intent patterns
+        self.prefix_pattern = re.compile(
+            r"^(?:please\s+)?(?:(?:plot|show|draw|create|make|display|generate|give)\s+(?:me\s+)?)?"
+            r"(?:(?:an?|the)\s+)?"
+        )
+
+        # Supported aggregations mapped to their pandas method
+        self.aggregations = {
+            "mean": "mean", "average": "mean", "avg": "mean",
+            "sum": "sum", "total": "sum",
+            "median": "median",
+            "max": "max", "maximum": "max",
+            "min": "min", "minimum": "min"
+        }
+
+        agg_words = "|".join(sorted(self.aggregations, key=len, reverse=True))
+        self.patterns = [
+            ("histogram", re.compile(r"^(?:histogram|distribution)\s+(?:of\s+)?(?P<x>.+)$")),
+            ("histogram", re.compile(r"^(?P<x>.+?)\s+(?:histogram|distribution)$")),
+            ("box", re.compile(r"^box\s*plot\s+(?:of\s+)?(?P<y>.+?)\s+(?:by|per|across)\s+(?P<x>.+)$")),
+            ("scatter", re.compile(
+                r"^(?:scatter\s*plot\s+(?:of\s+)?)?(?P<x>.+?)\s+(?:vs\.?|versus|against)\s+(?P<y>.+?)"
+                r"(?:\s+(?:colou?red|grouped|split)\s+by\s+(?P<hue>.+))?$"
+            )),
+            ("aggregate", re.compile(
+                rf"^(?P<agg>{agg_words})\s+(?:of\s+)?(?P<y>.+?)\s+(?:by|per|for each|across)\s+(?P<x>.+)$"
+            )),
+            ("count", re.compile(r"^(?:count|counts|number of rows)\s+(?:of\s+|by\s+|per\s+)(?P<x>.+)$"))
+        ]
+
+    def match(self, query: str, df: pd.DataFrame) -> Optional[Dict[str, Any]]:
+        """Return template code for the query, or None if the LLM should handle it"""
+        text = " ".join(query.lower().split()).rstrip(".?!")
+        text = self.prefix_pattern.sub("", text)
+        columns = list(df.columns)
+
+        for intent, pattern in self.patterns:
+            m = pattern.match(text)
+            if not m:
+                continue
+
+            # Resolve every captured phrase to a column
+            resolved = {}
+            confidence = 1.0
+            for role, phrase in m.groupdict().items():
+                if phrase is None or role == "agg":
+                    continue
+                column, score = self._resolve_column(phrase, columns)
+                if column is None:
+                    break
+                resolved[role] = column
+                confidence = min(confidence, score)
+            else:
+                if confidence < self.min_confidence:
+                    continue
+                builder = getattr(self, f"_{intent}_code")
+                code = builder(df, agg=m.groupdict().get("agg"), **resolved)
+                if code is None:
+                    continue
+                logger.info(f"Template match '{intent}' for query '{query}' (confidence {confidence:.2f})")
+                return {
+                    "intent": intent,
+                    "columns": resolved,
+                    "confidence": confidence,
+                    "code": code,
+                    "explanation": self._describe(intent, m.groupdict().get("agg"), resolved)
+                }
+
+        return None
+
+    def _resolve_column(self, phrase: str, columns: List[str]) -> Tuple[Optional[str], float]:
+        """Map a phrase from the query to a column name with a confidence score"""
+        phrase = re.sub(r"^the\s+", "", phrase.strip())
+        key = phrase.replace(" ", "_").replace("-", "_")
+
+        lookup = {col.lower(): col for col in columns}
+        if key in lookup:
+            return lookup[key], 1.0
+
+        # Simple plural, e.g. "ages" -> "age"
+        if key.endswith("s") and key[:-1] in lookup:
+            return lookup[key[:-1]], 0.9
+
+        close = difflib.get_close_matches(key, list(lookup), n=1, cutoff=self.min_confidence)
+        if close:
+            return lookup[close[0]], difflib.SequenceMatcher(None, key, close[0]).ratio()
+
+        return None, 0.0
+
+    def _is_numeric(self, df: pd.DataFrame, column: str) -> bool:
+        return pd.api.types.is_numeric_dtype(df[column]) and not pd.api.types.is_bool_dtype(df[column])
+
+    def _label(self, column: str) -> str:
+        return column.replace("_", " ").title()
+
+    def _histogram_code(self, df: pd.DataFrame, x: str, **kwargs) -> Optional[str]:
+        if not self._is_numeric(df, x):
+            return None
+        return f"""
+# Create histogram of {x}
+mean_value = df[{x!r}].mean()
+plt.figure(figsize=(10, 6))
+plt.hist(df[{x!r}].dropna(), bins=30, color='skyblue', edgecolor='black', alpha=0.7)
+plt.title({f'Distribution of {self._label(x)}'!r})
+plt.xlabel({self._label(x)!r})
+plt.ylabel('Count')
+plt.grid(True, alpha=0.3, linestyle='--')
+plt.axvline(mean_value, color='red', linestyle='dashed', linewidth=2, label=f'Mean: {{mean_value:.2f}}')
+plt.legend()
+plt.tight_layout()
+"""
+
+    def _scatter_code(self, df: pd.DataFrame, x: str, y: str, hue: str = None, **kwargs) -> Optional[str]:
+        if not (self._is_numeric(df, x) and self._is_numeric(df, y)):
+            return None
+        title = f"{self._label(x)} vs {self._label(y)}"
+        hue_arg = ""
+        if hue:
+            title += f" by {self._label(hue)}"
+            hue_arg = f", hue={hue!r}"
+        return f"""
+# Create scatter plot of {x} vs {y}
+plt.figure(figsize=(10, 6))
+sns.scatterplot(data=df, x={x!r}, y={y!r}{hue_arg}, alpha=0.7)
+plt.title({title!r})
+plt.xlabel({self._label(x)!r})
+plt.ylabel({self._label(y)!r})
+plt.grid(True, alpha=0.3, linestyle='--')
+plt.tight_layout()
+"""
+
+    def _aggregate_code(self, df: pd.DataFrame, x: str, y: str, agg: str, **kwargs) -> Optional[str]:
+        if not self._is_numeric(df, y) or x == y or df[x].nunique() > self.max_categories:
+            return None
+        method = self.aggregations[agg]
+        title = f"{method.title()} {self._label(y)} by {self._label(x)}"
+        return f"""
+# Calculate {method} of {y} by {x}, from the aggregate cube when it covers it
+result = cube.agg({x!r}, {y!r}, {method!r}) if cube is not None else None
+if result is None:
+    result = df.groupby({x!r})[{y!r}].{method}()
+
+# Create bar plot
+plt.figure(figsize=(10, 6))
+ax = result.plot(kind='bar', color='skyblue')
+plt.title({title!r})
+plt.xlabel({self._label(x)!r})
+plt.ylabel({f'{method.title()} {self._label(y)}'!r})
+plt.xticks(rotation=0 if len(result) <= 10 else 45)
+
+# Add value labels on bars
+for i, v in enumerate(result):
+    ax.text(i, v, f"{{v:.2f}}", ha='center', va='bottom')
+
+plt.grid(axis='y', linestyle='--', alpha=0.7)
+plt.tight_layout()
+"""
+
+    def _count_code(self, df: pd.DataFrame, x: str, **kwargs) -> Optional[str]:
+        if df[x].nunique() > self.max_categories:
+            return None
+        return f"""
+# Count rows per {x}
+counts = df[{x!r}].value_counts().sort_index()
+
+# Create bar plot
+plt.figure(figsize=(10, 6))
+ax = counts.plot(kind='bar', color='skyblue')
+plt.title({f'Count by {self._label(x)}'!r})
+plt.xlabel({self._label(x)!r})
+plt.ylabel('Count')
+plt.xticks(rotation=0 if len(counts) <= 10 else 45)
+
+# Add count labels on bars
+for i, v in enumerate(counts):
+    ax.text(i, v, str(v), ha='center', va='bottom')
+
+plt.grid(axis='y', linestyle='--', alpha=0.7)
+plt.tight_layout()
+"""
+
+    def _box_code(self, df: pd.DataFrame, x: str, y: str, **kwargs) -> Optional[str]:
+        if not self._is_numeric(df, y) or x == y or df[x].nunique() > self.max_categories:
+            return None
+        return f"""
+# Create box plot of {y} by {x}
+plt.figure(figsize=(10, 6))
+sns.boxplot(data=df, x={x!r}, y={y!r}, color='skyblue')
+plt.title({f'{self._label(y)} by {self._label(x)}'!r})
+plt.xlabel({self._label(x)!r})
+plt.ylabel({self._label(y)!r})
+plt.grid(axis='y', linestyle='--', alpha=0.7)
+plt.tight_layout()
+"""
+
+    def _describe(self, intent: str, agg: Optional[str], columns: Dict[str, str]) -> str:
+        """Short canned explanation for a template chart"""
+        x, y, hue = columns.get("x"), columns.get("y"), columns.get("hue")
+        if intent == "histogram":
+            return f"This histogram shows the distribution of {x}. The red dashed line marks the mean."
+        if intent == "scatter":
+            text = f"This scatter plot shows the relationship between {x} and {y}."
+            if hue:
+                text += f" Points are colored by {hue}."
+            return text
+        if intent == "aggregate":
+            return f"This bar chart shows the {self.aggregations[agg]} of {y} for each value of {x}."
+        if intent == "count":
+            return f"This bar chart shows the number of rows for each value of {x}."
+        if intent == "box":
+            return f"This box plot compares the distribution of {y} across values of {x}."
+        return ""
@@ -88,6 +88,32 @@ plt.tight_layout()
         The code should be complete and ready to execute with no imports needed.
         """
 
+    def session_prompt(self, query: str, columns: List[str], frames: Dict[str, str],
+                       history: List[str], aggregates: Optional[str] = None) -> str:
+        """Generate a prompt for a follow-up query in a conversational session"""
+        prompt = self.zero_shot_prompt(query, columns)
+        
+        if aggregates:
+            prompt += (f"\n{aggregates} Prefer it over df.groupby when it covers the aggregation, e.g.\n"
+                       "result = cube.agg('a', 'b', 'mean')\n"
+                       "if result is None:\n"
+                       "    result = df.groupby('a')['b'].mean()\n")
+        
+        if history:
+            prompt += "\nPrevious questions in this conversation, oldest first:\n"
+            for previous in history:
+                prompt += f"- {previous}\n"
+        
+        if frames:
+            prompt += "\nThese intermediate results from earlier steps are already available as variables:\n"
+            for name, description in frames.items():
+                prompt += f"- {name}: {description}\n"
+            prompt += ("When the question follows up on an earlier step, work from these variables "
+                       "instead of recomputing from df. Assign new intermediate results to descriptive "
+                       "variable names so later questions can reuse them.\n")
+        
+        return prompt
+
     def few_shot_prompt(self, query: str, columns: List[str], dataset_type: str = None) -> str:
         """Generate a few-shot prompt with examples for the LLM"""
         # Base prompt
@@ -0,0 +1,68 @@
+import threading
+import logging
+from typing import Any, Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+class _InFlightCall:
+    """A computation that is currently running, shared by all identical callers"""
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class RequestCoalescer:
+    """Single-flight coalescing of identical concurrent requests.
+
+    The first caller for a key runs the computation; callers arriving with the
+    same key while it is still running block until it finishes and receive the
+    same result (or exception). Nothing is kept once the call completes, so
+    this is not a cache.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight: Dict[Hashable, _InFlightCall] = {}
+        self.stats = {
+            "executed": 0,   # computations actually run
+            "coalesced": 0,  # requests that reused an in-flight computation
+            "errors": 0      # computations that raised
+        }
+
+    def run(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        """Run func for key, or wait on an identical in-flight call"""
+        with self._lock:
+            call = self._in_flight.get(key)
+            if call is not None:
+                self.stats["coalesced"] += 1
+                leader = False
+            else:
+                call = _InFlightCall()
+                self._in_flight[key] = call
+                self.stats["executed"] += 1
+                leader = True
+
+        if not leader:
+            logger.info(f"Coalescing request onto in-flight computation for {key}")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as e:
+            # Waiters must never see a missing result, whatever the leader raised
+            call.error = e if isinstance(e, Exception) else RuntimeError(f"Coalesced computation aborted: {e!r}")
+            with self._lock:
+                self.stats["errors"] += 1
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            call.done.set()
+
+    def get_stats(self) -> Dict[str, int]:
+        """Return coalescing counters and the number of calls currently in flight"""
+        with self._lock:
+            return dict(self.stats, in_flight=len(self._in_flight))
@@ -0,0 +1,140 @@
+import time
+import threading
+import logging
+import pandas as pd
+from collections import OrderedDict
+from typing import Dict, Any
+
+logger = logging.getLogger(__name__)
+
+class Session:
+    """Conversation state for one chat: recent queries and intermediate frames"""
+    def __init__(self, session_id: str, dataset_id: str):
+        self.session_id = session_id
+        self.dataset_id = dataset_id
+        self.frames = OrderedDict()  # name -> DataFrame/Series, least recently used first
+        self.frame_bytes = {}        # name -> memory usage of the frame
+        self.history = []            # previous queries, oldest first
+        self.last_access = time.time()
+
+class SessionManager:
+    """Server-side chat sessions with a bounded cache of intermediate DataFrames.
+
+    Frames produced by earlier steps (a filtered subset, an aggregated table)
+    are kept per session so follow-up questions can build on them instead of
+    recomputing from the full dataset. Sessions are only created for callers
+    that pass a session id, expire after an idle timeout, and are evicted least
+    recently used first when the global session or frame-byte budget is spent.
+    """
+    def __init__(self, max_frames: int = 5, max_frame_bytes: int = 50 * 1024 * 1024,
+                 max_history: int = 5, idle_timeout: int = 30 * 60,
+                 max_sessions: int = 100, max_total_bytes: int = 512 * 1024 * 1024):
+        self.max_frames = max_frames
+        self.max_frame_bytes = max_frame_bytes
+        self.max_history = max_history
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.max_total_bytes = max_total_bytes
+        self.sessions: "OrderedDict[str, Session]" = OrderedDict()  # least recently used first
+        self.total_bytes = 0
+        self._lock = threading.Lock()
+
+    def get_session(self, session_id: str, dataset_id: str) -> Session:
+        """Return the session for session_id, creating or resetting it as needed"""
+        with self._lock:
+            self._expire_idle()
+
+            session = self.sessions.get(session_id)
+            if session is None or session.dataset_id != dataset_id:
+                # Frames derived from another dataset are meaningless here
+                if session is not None:
+                    self._drop(session_id)
+                session = Session(session_id, dataset_id)
+                self.sessions[session_id] = session
+
+                while len(self.sessions) > self.max_sessions:
+                    oldest = next(iter(self.sessions))
+                    logger.info(f"Evicting least recently used session {oldest}")
+                    self._drop(oldest)
+
+            self.sessions.move_to_end(session_id)
+            session.last_access = time.time()
+            return session
+
+    def get_frames(self, session: Session) -> Dict[str, Any]:
+        """Return a snapshot of the session's cached frames"""
+        with self._lock:
+            return dict(session.frames)
+
+    def describe_frames(self, session: Session) -> Dict[str, str]:
+        """Return a short description of each cached frame for the prompt"""
+        descriptions = {}
+        for name, frame in self.get_frames(session).items():
+            if isinstance(frame, pd.DataFrame):
+                columns = ", ".join(str(col) for col in frame.columns)
+                descriptions[name] = f"DataFrame with {len(frame)} rows and columns: {columns}"
+            else:
+                index_name = frame.index.name or "index"
+                descriptions[name] = f"Series '{frame.name}' with {len(frame)} values indexed by {index_name}"
+        return descriptions
+
+    def record_step(self, session: Session, query: str, produced: Dict[str, Any]):
+        """Store the query and the frames its code produced, evicting the oldest"""
+        with self._lock:
+            if self.sessions.get(session.session_id) is not session:
+                # Evicted or expired while the request was running
+                return
+
+            session.history.append(query)
+            del session.history[:-self.max_history]
+
+            for name, frame in produced.items():
+                size = frame.memory_usage(deep=True)
+                size = int(size.sum() if isinstance(size, pd.Series) else size)
+                if size > self.max_frame_bytes:
+                    logger.info(f"Not caching frame '{name}' ({size} bytes) for session {session.session_id}")
+                    continue
+                self._remove_frame(session, name)
+                session.frames[name] = frame
+                session.frame_bytes[name] = size
+                self.total_bytes += size
+
+            while len(session.frames) > self.max_frames:
+                self._remove_frame(session, next(iter(session.frames)))
+
+            session.last_access = time.time()
+            self.sessions.move_to_end(session.session_id)
+
+            # Free frames of the least recently used sessions first
+            for other in list(self.sessions.values()):
+                if self.total_bytes <= self.max_total_bytes:
+                    break
+                while other.frames and self.total_bytes > self.max_total_bytes:
+                    self._remove_frame(other, next(iter(other.frames)))
+
+    def end_session(self, session_id: str) -> bool:
+        """Drop a session and its cached frames"""
+        with self._lock:
+            if session_id not in self.sessions:
+                return False
+            self._drop(session_id)
+            return True
+
+    def _remove_frame(self, session: Session, name: str):
+        """Remove one cached frame (caller holds the lock)"""
+        if name in session.frames:
+            del session.frames[name]
+            self.total_bytes -= session.frame_bytes.pop(name)
+
+    def _drop(self, session_id: str):
+        """Remove a session and release its frame bytes (caller holds the lock)"""
+        session = self.sessions.pop(session_id)
+        self.total_bytes -= sum(session.frame_bytes.values())
+
+    def _expire_idle(self):
+        """Remove sessions idle for longer than the timeout (caller holds the lock)"""
+        cutoff = time.time() - self.idle_timeout
+        expired = [sid for sid, s in self.sessions.items() if s.last_access < cutoff]
+        for sid in expired:
+            logger.info(f"Expiring idle session {sid}")
+            self._drop(sid)